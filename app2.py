@@ -1,25 +1,45 @@
 import struct, os, subprocess
 
+# Optional: render and encode in-process when pyfluidsynth and lameenc are
+# installed, otherwise fall back to the fluidsynth | ffmpeg pipeline.
+try:
+    import fluidsynth, lameenc
+except ImportError:
+    fluidsynth = lameenc = None
+
 PPQN = 480
 
-def write_varlen(value):
-    out = [value & 0x7F]
-    value >>= 7
-    while value:
-        out.insert(0, (value & 0x7F) | 0x80)
-        value >>= 7
-    return out
+_HDR = struct.Struct(">IHHH")
+_MTRK_LEN = struct.Struct(">I")
+_MSG3 = struct.Struct("BBB")
+
+def write_varlen_into(buf, value):
+    if value < 0x80:
+        buf.append(value)
+    elif value < 0x4000:
+        buf.append((value >> 7) | 0x80)
+        buf.append(value & 0x7F)
+    elif value < 0x200000:
+        buf.append((value >> 14) | 0x80)
+        buf.append(((value >> 7) & 0x7F) | 0x80)
+        buf.append(value & 0x7F)
+    else:
+        buf.append((value >> 21) | 0x80)
+        buf.append(((value >> 14) & 0x7F) | 0x80)
+        buf.append(((value >> 7) & 0x7F) | 0x80)
+        buf.append(value & 0x7F)
 
 def build_track(events):
     events = sorted(events, key=lambda x: x[0])
     data = bytearray()
     last = 0
+    extend, wv = data.extend, write_varlen_into
     for tick, msg in events:
         delta = tick - last
         last = tick
-        data.extend(write_varlen(delta))
-        data.extend(msg)
-    data.extend(write_varlen(0))
+        wv(data, delta)
+        extend(msg)
+    write_varlen_into(data, 0)
     data.extend([0xFF, 0x2F, 0x00])
     return bytes(data)
 
@@ -54,15 +74,19 @@ t0_data = build_track(t0)
 #   Chords Track (happy synth)
 # ------------------------------
 
+# note-on/off messages per chord, packed once
+chord_msgs = [
+    [(_MSG3.pack(0x90, scale[d], 90), _MSG3.pack(0x80, scale[d], 40)) for d in degs]
+    for degs in chord_degrees
+]
+
 chords=[]
 for bar in range(bars):
-    degs = chord_degrees[bar % 4]
     st = bar * bar_ticks
     et = st + bar_ticks
-    for d in degs:
-        note = scale[d]
-        chords.append((st, [0x90, note, 90]))
-        chords.append((et, [0x80, note, 40]))
+    for on, off in chord_msgs[bar % 4]:
+        chords.append((st, on))
+        chords.append((et, off))
 
 t1_data = build_track(chords)
 
@@ -75,13 +99,18 @@ pattern = [5, 6, 4, 2, 3, 4, 1, 2]   # melodic hop
 
 dur = PPQN // 2  # 8th notes
 
+# one octave up
+pattern_msgs = [(_MSG3.pack(0x91, scale[d] + 12, 110), _MSG3.pack(0x81, scale[d] + 12, 50)) for d in pattern]
+
+# tick offset of each note within the bar, computed once
+pattern_offsets = [i * dur for i in range(len(pattern))]
+
 for bar in range(bars):
     base = bar * bar_ticks
-    for i, d in enumerate(pattern):
-        st = base + i * dur
-        note = scale[d] + 12  # one octave up
-        melody.append((st, [0x91, note, 110]))
-        melody.append((st + dur, [0x81, note, 50]))
+    for st, (on, off) in zip(pattern_offsets, pattern_msgs):
+        st += base
+        melody.append((st, on))
+        melody.append((st + dur, off))
 
 t2_data = build_track(melody)
 
@@ -94,26 +123,32 @@ kick=36
 sn=38
 hat=42
 
+kick_on,kick_off=_MSG3.pack(0x99,kick,100),_MSG3.pack(0x89,kick,60)
+sn_on,sn_off=_MSG3.pack(0x99,sn,70),_MSG3.pack(0x89,sn,40)
+hat_on,hat_off=_MSG3.pack(0x99,hat,60),_MSG3.pack(0x89,hat,30)
+
+release = PPQN//4   # every drum hit is released a 16th later
+kick_ticks = [0, 2*PPQN]                       # Kick on 1 & 3
+sn_ticks = [PPQN, 3*PPQN]                      # Snare soft on 2 & 4
+hat_ticks = [i*(PPQN//2) for i in range(8)]    # Cute hi-hats 8th notes
+
 for bar in range(bars):
     bs = bar * bar_ticks
 
-    # Kick on 1 & 3
-    for beat in [0, 2]:
-        t = bs + beat * PPQN
-        dr.append((t,[0x99,kick,100]))
-        dr.append((t+PPQN//4,[0x89,kick,60]))
+    for t in kick_ticks:
+        t += bs
+        dr.append((t,kick_on))
+        dr.append((t+release,kick_off))
 
-    # Snare soft on 2 & 4
-    for beat in [1, 3]:
-        t = bs + beat * PPQN
-        dr.append((t,[0x99,sn,70]))
-        dr.append((t+PPQN//4,[0x89,sn,40]))
+    for t in sn_ticks:
+        t += bs
+        dr.append((t,sn_on))
+        dr.append((t+release,sn_off))
 
-    # Cute hi-hats 8th notes
-    for i in range(8):
-        t = bs + i*(PPQN//2)
-        dr.append((t,[0x99,hat,60]))
-        dr.append((t+PPQN//4,[0x89,hat,30]))
+    for t in hat_ticks:
+        t += bs
+        dr.append((t,hat_on))
+        dr.append((t+release,hat_off))
 
 t3_data = build_track(dr)
 
@@ -121,56 +156,102 @@ t3_data = build_track(dr)
 #   Write MIDI File
 # ------------------------------
 
-header=b"MThd"+struct.pack(">IHHH",6,1,4,PPQN)
-tracks=[
-    b"MTrk"+struct.pack(">I",len(t0_data))+t0_data,
-    b"MTrk"+struct.pack(">I",len(t1_data))+t1_data,
-    b"MTrk"+struct.pack(">I",len(t2_data))+t2_data,
-    b"MTrk"+struct.pack(">I",len(t3_data))+t3_data,
-]
+# Collect the chunk pieces and write them as-is, no per-track concatenation
+parts=[b"MThd",_HDR.pack(6,1,4,PPQN)]
+append=parts.append
+for t in (t0_data,t1_data,t2_data,t3_data):
+    append(b"MTrk")
+    append(_MTRK_LEN.pack(len(t)))
+    append(t)
 
 midi_path="cute_kpop.mid"
-wav_path="cute_kpop.wav"
 mp3_path="cute_kpop.mp3"
 
 with open(midi_path,"wb") as f:
-    f.write(header + b"".join(tracks))
+    f.writelines(parts)
 
 print("Saved MIDI:", midi_path)
 
 # ------------------------------
-#   MIDI → WAV (FluidSynth)
+#   MIDI → MP3
 # ------------------------------
 
 SOUNDFONT_PATH="FluidR3_GM.sf2"   # update if needed
 
-fs_cmd=[
-    "fluidsynth",
-    "-ni",
-    "-F", wav_path,
-    "-T", "wav",
-    "-r", "44100",
-    "-g", "0.9",
-    SOUNDFONT_PATH,
-    midi_path
-]
-
-print("Running FluidSynth...")
-subprocess.run(fs_cmd, check=True)
-print("Rendered WAV:", wav_path)
-
-# ------------------------------
-#   WAV → MP3 (ffmpeg)
-# ------------------------------
-
-ff_cmd=[
-    "ffmpeg","-y",
-    "-i",wav_path,
-    "-codec:a","libmp3lame",
-    "-b:a","320k",
-    mp3_path
-]
 
-print("Running ffmpeg...")
-subprocess.run(ff_cmd, check=True)
+def render_mp3_in_process():
+    # Synthesize PCM blocks with libfluidsynth and feed them straight to
+    # LAME: no subprocesses, no pipe, only the MP3 is written.
+    synth=fluidsynth.Synth(gain=0.9, samplerate=44100.0)
+    # Advance the MIDI player by rendered samples, not wall-clock time,
+    # like fluidsynth -F does
+    synth.setting("player.timing-source", "sample")
+    try:
+        if synth.sfload(SOUNDFONT_PATH) == fluidsynth.FLUID_FAILED:
+            raise RuntimeError("Could not load soundfont: " + SOUNDFONT_PATH)
+        enc=lameenc.Encoder()
+        enc.set_bit_rate(320)
+        enc.set_in_sample_rate(44100)
+        enc.set_channels(2)
+        if synth.play_midi_file(midi_path) == fluidsynth.FLUID_FAILED:
+            raise RuntimeError("Could not play MIDI file: " + midi_path)
+        with open(mp3_path,"wb") as f:
+            while fluidsynth.fluid_player_get_status(synth.player) == fluidsynth.FLUID_PLAYER_PLAYING:
+                # interleaved stereo int16, 4096 frames per block
+                f.write(enc.encode(synth.get_samples(4096).tobytes()))
+            f.write(enc.flush())
+        synth.play_midi_stop()
+    finally:
+        synth.delete()
+
+
+def render_mp3_pipeline():
+    # FluidSynth renders raw s16le PCM to stdout and ffmpeg encodes it
+    # straight from the pipe, so no intermediate WAV is written to disk.
+    fs_cmd=[
+        "fluidsynth",
+        "-ni",
+        "-q",
+        "-F", "-",
+        "-T", "raw",
+        "-o", "audio.file.format=s16",
+        "-o", "audio.file.endian=little",
+        "-r", "44100",
+        "-g", "0.9",
+        SOUNDFONT_PATH,
+        midi_path
+    ]
+
+    ff_cmd=[
+        "ffmpeg","-y",
+        "-f","s16le","-ar","44100","-ac","2",
+        "-i","pipe:0",
+        "-codec:a","libmp3lame",
+        "-b:a","320k",
+        mp3_path
+    ]
+
+    fluid=subprocess.Popen(fs_cmd, stdout=subprocess.PIPE)
+    try:
+        ff=subprocess.Popen(ff_cmd, stdin=fluid.stdout)
+    except BaseException:
+        fluid.kill()
+        fluid.wait()
+        raise
+    fluid.stdout.close()  # so FluidSynth gets SIGPIPE if ffmpeg exits early
+    ff_rc=ff.wait()
+    fs_rc=fluid.wait()
+    # ffmpeg first: when it fails, FluidSynth's SIGPIPE death is only a symptom
+    if ff_rc:
+        raise subprocess.CalledProcessError(ff_rc, ff_cmd)
+    if fs_rc:
+        raise subprocess.CalledProcessError(fs_rc, fs_cmd)
+
+
+if fluidsynth is not None and lameenc is not None:
+    print("Rendering in-process (pyfluidsynth + lameenc)...")
+    render_mp3_in_process()
+else:
+    print("Running FluidSynth | ffmpeg...")
+    render_mp3_pipeline()
 print("Exported MP3:", mp3_path)
@@ -1,11 +1,26 @@
 import struct
-import random
 import os
-from dataclasses import dataclass
-from typing import Dict, List, Tuple
+import hashlib
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from dataclasses import astuple, dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # optional accelerator; the same kernel runs as plain Python
+    njit = None
 
 PPQN = 480 
 
+_HDR = struct.Struct(">IHHH")
+_MTRK_LEN = struct.Struct(">I")
+_MSG3 = struct.Struct("BBB")
+
 @dataclass
 class SongParams:
     bpm: int = 124
@@ -23,29 +38,127 @@ class SongParams:
     bass_octave: int = 2
 
 # --- MIDI Low Level Utilities ---
-def write_varlen(value: int) -> List[int]:
+def write_varlen_into(buf: bytearray, off: int, value: int) -> int:
     # Ensure value is an integer and at least 0
     value = max(0, int(value))
-    
-    out = [value & 0x7F]
-    value >>= 7
-    while value > 0: # Use > 0 explicitly
-        out.insert(0, (value & 0x7F) | 0x80)
-        value >>= 7
-    return out
-
-def build_track(events: List[Tuple[int, List[int]]]) -> bytes:
-    events = sorted(events, key=lambda x: x[0])
-    data = bytearray()
+
+    # Deltas on this grid are almost always < 2^14, so test short forms first
+    if value < 0x80:
+        buf[off] = value
+        return off + 1
+    if value < 0x4000:
+        buf[off] = (value >> 7) | 0x80
+        buf[off + 1] = value & 0x7F
+        return off + 2
+    if value < 0x200000:
+        buf[off] = (value >> 14) | 0x80
+        buf[off + 1] = ((value >> 7) & 0x7F) | 0x80
+        buf[off + 2] = value & 0x7F
+        return off + 3
+    # MIDI VLQs are at most 4 bytes
+    if value >= 0x10000000:
+        raise ValueError(f"delta {value} does not fit a MIDI variable-length quantity")
+    buf[off] = (value >> 21) | 0x80
+    buf[off + 1] = ((value >> 14) & 0x7F) | 0x80
+    buf[off + 2] = ((value >> 7) & 0x7F) | 0x80
+    buf[off + 3] = value & 0x7F
+    return off + 4
+
+def write_varlen(value: int) -> bytes:
+    out = bytearray(4)
+    return bytes(out[:write_varlen_into(out, 0, value)])
+
+def _track_capacity(events: List[Tuple[int, bytes]]) -> int:
+    # Chunk header + worst-case 4-byte delta per event + end-of-track
+    return 8 + sum(4 + len(msg) for _, msg in events) + 7
+
+def write_track_into(buf: bytearray, off: int, events: List[Tuple[int, bytes]], presorted: bool = False) -> int:
+    # Writes a full MTrk chunk at `off`; the length is patched in once the
+    # events are serialized, so nothing is built up and copied afterwards.
+    if not presorted:
+        events = sorted(events, key=itemgetter(0))
+    hdr_off = off
+    off += 8
     last = 0
+    wv = write_varlen_into
     for tick, msg in events:
         delta = tick - last
         last = tick
-        data.extend(write_varlen(delta))
-        data.extend(msg)
-    data.extend(write_varlen(0))
-    data.extend([0xFF, 0x2F, 0x00])
-    return bytes(data)
+        off = wv(buf, off, delta)
+        end = off + len(msg)
+        buf[off:end] = msg
+        off = end
+    off = write_varlen_into(buf, off, 0)
+    buf[off:off + 3] = b"\xff\x2f\x00"
+    off += 3
+    buf[hdr_off:hdr_off + 4] = b"MTrk"
+    _MTRK_LEN.pack_into(buf, hdr_off + 4, off - hdr_off - 8)
+    return off
+
+def _emit_events(ticks, msgs, out, off):
+    # Kernel shared by both paths: `msgs` holds 3 bytes per event, flattened,
+    # so it indexes the same way as NumPy arrays (numba) or lists/bytes.
+    last = 0
+    for k in range(len(ticks)):
+        tick = ticks[k]
+        value = tick - last
+        last = tick
+        if value < 0:
+            value = 0
+        if value >= 0x10000000:
+            raise ValueError("delta does not fit a MIDI variable-length quantity")
+        if value >= 0x200000:
+            out[off] = (value >> 21) | 0x80
+            off += 1
+        if value >= 0x4000:
+            out[off] = ((value >> 14) & 0x7F) | 0x80
+            off += 1
+        if value >= 0x80:
+            out[off] = ((value >> 7) & 0x7F) | 0x80
+            off += 1
+        out[off] = value & 0x7F
+        m = 3 * k
+        out[off + 1] = msgs[m]
+        out[off + 2] = msgs[m + 1]
+        out[off + 3] = msgs[m + 2]
+        off += 4
+    return off
+
+# Compiled once at import rather than on the first song. No on-disk cache:
+# it records the module name, breaking imports under another package path.
+# Any failure leaves the pure-Python kernel in place.
+_emit_events_jit = None
+if njit is not None:
+    try:
+        _emit_events_jit = njit(_emit_events)
+        _emit_events_jit(np.zeros(1, np.int64), np.zeros(3, np.uint8), np.zeros(7, np.uint8), 0)
+    except Exception:
+        _emit_events_jit = None
+
+def write_events_into(buf: bytearray, off: int, ticks: np.ndarray, msgs: np.ndarray, presorted: bool = False) -> int:
+    # Array form of write_track_into for channel-message tracks: `ticks` is
+    # (N,) int64 and `msgs` is (N, 3) uint8.
+    ticks = np.ascontiguousarray(ticks, dtype=np.int64)
+    msgs = np.ascontiguousarray(msgs, dtype=np.uint8)
+    if not presorted:
+        order = np.argsort(ticks, kind="stable")
+        ticks, msgs = ticks[order], msgs[order]
+    hdr_off = off
+    if _emit_events_jit is not None:
+        off = _emit_events_jit(ticks, msgs.ravel(), np.frombuffer(buf, dtype=np.uint8), off + 8)
+    else:
+        off = _emit_events(ticks.tolist(), msgs.tobytes(), buf, off + 8)
+    off = write_varlen_into(buf, off, 0)
+    buf[off:off + 3] = b"\xff\x2f\x00"
+    off += 3
+    buf[hdr_off:hdr_off + 4] = b"MTrk"
+    _MTRK_LEN.pack_into(buf, hdr_off + 4, off - hdr_off - 8)
+    return off
+
+def build_track(events: List[Tuple[int, bytes]], presorted: bool = False) -> bytes:
+    buf = bytearray(_track_capacity(events))
+    end = write_track_into(buf, 0, events, presorted)
+    return bytes(memoryview(buf)[8:end])
 
 # --- Musical Theory Engine ---
 NOTE_TO_SEMI = {"C":0,"C#":1,"Db":1,"D":2,"D#":3,"Eb":3,"E":4,"F":5,"F#":6,"Gb":6,"G":7,"G#":8,"Ab":8,"A":9,"A#":10,"Bb":10,"B":11}
@@ -53,132 +166,244 @@ NOTE_TO_SEMI = {"C":0,"C#":1,"Db":1,"D":2,"D#":3,"Eb":3,"E":4,"F":5,"F#":6,"Gb":
 def midi_note(note_name: str, octave: int) -> int:
     return 12 * (octave + 1) + NOTE_TO_SEMI[note_name]
 
+# Major vs Natural Minor intervals
+MAJOR_INTERVALS = (0, 2, 4, 5, 7, 9, 11)
+MINOR_INTERVALS = (0, 2, 3, 5, 7, 8, 10)
+
+ROMAN_TO_DEGREE = {"i": 0, "ii": 1, "iii": 2, "iv": 3, "v": 4, "vi": 5, "vii": 6,
+                   "I": 0, "II": 1, "III": 2, "IV": 3, "V": 4, "VI": 5, "VII": 6}
+
 def build_scale(root_note: str, mode: str, base_octave: int) -> List[int]:
     root = midi_note(root_note, base_octave)
-    # Major vs Natural Minor intervals
-    intervals = [0, 2, 4, 5, 7, 9, 11] if mode.lower() == "major" else [0, 2, 3, 5, 7, 8, 10]
+    intervals = MAJOR_INTERVALS if mode.lower() == "major" else MINOR_INTERVALS
     return [root + i for i in intervals]
 
 def roman_to_degree(roman: str) -> int:
-    mapping = {"i": 0, "ii": 1, "iii": 2, "iv": 3, "v": 4, "vi": 5, "vii": 6,
-               "I": 0, "II": 1, "III": 2, "IV": 3, "V": 4, "VI": 5, "VII": 6}
-    return mapping.get(roman.strip().replace("°", ""), 0)
+    return ROMAN_TO_DEGREE.get(roman.strip().replace("°", ""), 0)
 
 # --- Core Generators ---
 
-def make_chords(params: SongParams, bar_ticks: int):
-    rng = random.Random(params.seed)
-    scale = build_scale(params.key, params.mode, params.chord_octave)
-    tokens = [t.strip() for t in params.progression.replace("|", "-").split("-") if t.strip()]
-    
-    events, chord_degs_per_bar = [], []
-    for bar in range(params.bars):
-        root_deg = roman_to_degree(tokens[bar % len(tokens)])
-        triad_degs = [root_deg % 7, (root_deg + 2) % 7, (root_deg + 4) % 7]
-        chord_degs_per_bar.append(triad_degs)
-        
+def _song_rng(seed, offset: int = 0) -> np.random.Generator:
+    # default_rng only takes non-negative ints; map any int seed onto that
+    # range (and floats through hash) so every seed random.Random accepted
+    # still gives a reproducible song
+    if isinstance(seed, float):
+        seed = hash(seed)
+    elif not isinstance(seed, int):
+        raise TypeError(f"seed must be an int or float, not {type(seed).__name__}")
+    return np.random.default_rng((seed + offset) % 2**64)
+
+def _channel_messages(status: int, notes: np.ndarray, vels) -> np.ndarray:
+    # Vectorized _MSG3.pack: note/velocity arrays -> (..., 3) uint8 rows,
+    # rejecting out-of-range bytes the way struct does
+    msgs = np.stack(np.broadcast_arrays(status, notes, vels), axis=-1)
+    if msgs.size and (msgs.min() < 0 or msgs.max() > 255):
+        raise ValueError("MIDI message byte out of range")
+    return msgs.astype(np.uint8)
+
+@lru_cache(maxsize=128)
+def _chord_plan(key: str, mode: str, chord_octave: int, progression: str) -> Tuple[np.ndarray, np.ndarray]:
+    # Everything about the chords that doesn't depend on the seed: triad
+    # degrees and voicing of each progression step, as read-only (steps, 3)
+    # arrays. Cached so repeated requests for the same harmony skip the
+    # theory work.
+    scale = build_scale(key, mode, chord_octave)
+    tokens = [t.strip() for t in progression.replace("|", "-").split("-") if t.strip()]
+    if not tokens:
+        raise ValueError(f"progression {progression!r} has no chords")
+
+    # Triad and voicing for each of the 7 root degrees
+    voicings: Dict[int, Tuple[Tuple[int, int, int], Tuple[int, int, int]]] = {}
+    for root_deg in range(7):
+        triad_degs = (root_deg, (root_deg + 2) % 7, (root_deg + 4) % 7)
         # OPEN VOICING: Dropping the middle note makes it sound "Professional"
         # Root, 5th (standard), and 3rd (pushed up an octave)
-        notes = [
+        notes = (
             scale[triad_degs[0]],       # Root
             scale[triad_degs[2]],       # 5th
             scale[triad_degs[1]] + 12   # 3rd (up one octave for "lush" sound)
-        ]
-        
-        st, et = bar * bar_ticks, (bar + 1) * bar_ticks
-        for n in notes:
-            # Humanize: Real players don't hit all notes at once (Arpeggiation)
-            stagger = rng.randint(0, 40) 
-            vel = int(65 + 15 * params.energy + rng.randint(-5, 5))
-            events.append((st + stagger, [0x90, int(n), vel]))
-            events.append((et - 100, [0x80, int(n), 0]))
-            
-    return events, chord_degs_per_bar
-
-def make_melody(params: SongParams, chord_degs_per_bar: List[List[int]], bar_ticks: int):
-    rng = random.Random(params.seed + 123)
-    lead_scale = build_scale(params.key, params.mode, params.melody_octave)
-    events = []
+        )
+        voicings[root_deg] = (triad_degs, notes)
+
+    plan = [voicings[roman_to_degree(t)] for t in tokens]
+    triads = np.array([triad for triad, _ in plan], dtype=np.intp)
+    notes = np.array([notes for _, notes in plan], dtype=np.int64)
+    triads.setflags(write=False)
+    notes.setflags(write=False)
+    return triads, notes
+
+def make_chords(params: SongParams, bar_ticks: int, rng: Optional[np.random.Generator] = None):
+    if rng is None:
+        rng = _song_rng(params.seed)
+    triads, voicing = _chord_plan(params.key, params.mode, params.chord_octave, params.progression)
+
+    # Humanize randomness for all three notes of every bar, drawn in bulk
+    staggers = rng.integers(0, 41, (params.bars, 3))
+    vel_noise = rng.integers(-5, 6, (params.bars, 3))
+
+    bar_step = np.arange(params.bars) % len(triads)
+    chord_degs_per_bar = triads[bar_step]
+    notes = voicing[bar_step]
+
+    # Humanize: Real players don't hit all notes at once (Arpeggiation).
+    # Each bar's note-ons are put in stagger order (stable, like list.sort).
+    order = np.argsort(staggers, axis=1, kind="stable")
+    on_ticks = np.take_along_axis(staggers, order, axis=1)
+    on_notes = np.take_along_axis(notes, order, axis=1)
+    vel = (65 + 15 * params.energy + np.take_along_axis(vel_noise, order, axis=1)).astype(np.int64)
+
+    # Per bar: the three note-ons, then the releases, all on et - 100, which
+    # is after every note-on of the bar and before the next bar
+    st = np.arange(params.bars)[:, None] * bar_ticks
+    ticks = np.concatenate([st + on_ticks, np.repeat(st + bar_ticks - 100, 3, axis=1)], axis=1)
+    msgs = np.concatenate([_channel_messages(0x90, on_notes, vel), _channel_messages(0x80, notes, 0)], axis=1)
+    return (ticks.ravel(), msgs.reshape(-1, 3)), chord_degs_per_bar
+
+def make_melody(params: SongParams, chord_degs_per_bar: np.ndarray, bar_ticks: int,
+                rng: Optional[np.random.Generator] = None):
+    if rng is None:
+        rng = _song_rng(params.seed, 123)
+    lead_scale = np.asarray(build_scale(params.key, params.mode, params.melody_octave))
     
     # Syncopated Rhythm Pattern (16-step grid)
     # This creates a "Call and Response" feel rather than random notes
-    rhythm = [1, 0, 0, 1, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0]
-
-    for bar in range(params.bars):
-        base_tick = bar * bar_ticks
-        chord_tones = chord_degs_per_bar[bar]
-        
-        for i, hit in enumerate(rhythm):
-            if not hit: continue
-            
-            # Select note: Priority on chord tones for "Realness"
-            if i % 4 == 0 or rng.random() < 0.7:
-                deg = rng.choice(chord_tones)
-            else:
-                deg = rng.choice(range(7))
-            
-            note = lead_scale[deg]
-            
-            # Humanization: Micro-timing (not perfectly on the grid)
-            shift = rng.randint(-20, 20)
-            st = base_tick + (i * (PPQN // 4)) + shift
-            
-            # Humanization: Velocity accenting
-            vel = 100 if i == 0 else (85 if i % 4 == 0 else 70)
-            vel += rng.randint(-10, 10)
-
-            duration = (PPQN // 4) + rng.randint(-50, 50)
-            events.append((st, [0x91, int(note), int(vel)]))
-            events.append((st + duration, [0x81, int(note), 0]))
-            
-    return events
-
-def make_drums(params: SongParams, bar_ticks: int):
-    rng = random.Random(params.seed + 999)
-    dr = []
-    for bar in range(params.bars):
-        bs = bar * bar_ticks
-        for i in range(16):
-            t = bs + i * (PPQN // 4)
-            # Kick on 1 and 3
-            if i in [0, 8]:
-                dr.append((t, [0x99, 36, 110]))
-                dr.append((t + 100, [0x89, 36, 0]))
-            # Snare on 4 and 12
-            if i in [4, 12]:
-                dr.append((t, [0x99, 38, 100]))
-                dr.append((t + 100, [0x89, 38, 0]))
-            # Hi-Hats with "Groove" (loud-soft-loud-soft)
-            if i % 2 == 0:
-                vel = 90 if i % 4 == 0 else 65
-                dr.append((t, [0x99, 42, vel + rng.randint(-5, 5)]))
-                dr.append((t + 60, [0x89, 42, 0]))
-    return dr
+    rhythm = np.array([1, 0, 0, 1, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0])
+    steps = np.flatnonzero(rhythm)
+
+    # Every hit of every bar is computed at once on a (bars, hits) grid
+    grid = (params.bars, len(steps))
+
+    # Select note: Priority on chord tones for "Realness"
+    chord_tones = np.asarray(chord_degs_per_bar, dtype=np.intp).reshape(params.bars, 3)
+    chord_deg = np.take_along_axis(chord_tones, rng.integers(0, 3, grid), axis=1)
+    use_chord = (steps % 4 == 0) | (rng.random(grid) < 0.7)
+    note = lead_scale[np.where(use_chord, chord_deg, rng.integers(0, 7, grid))]
+
+    # Humanization: Micro-timing (not perfectly on the grid)
+    shift = rng.integers(-20, 21, grid)
+    st = np.arange(params.bars)[:, None] * bar_ticks + steps * (PPQN // 4) + shift
+
+    # Humanization: Velocity accenting
+    vel = np.where(steps == 0, 100, np.where(steps % 4 == 0, 85, 70)) + rng.integers(-10, 11, grid)
+
+    et = st + (PPQN // 4) + rng.integers(-50, 51, grid)
+
+    # Note-offs and note-ons are each in tick order; a stable argsort over
+    # offs-then-ons merges them so a release sharing a tick with the next
+    # hit precedes it
+    ticks = np.concatenate([et.ravel(), st.ravel()])
+    msgs = np.concatenate([_channel_messages(0x81, note, 0).reshape(-1, 3),
+                           _channel_messages(0x91, note, vel).reshape(-1, 3)])
+    order = np.argsort(ticks, kind="stable")
+    return ticks[order], msgs[order]
+
+# Drum messages that never change are packed once and shared by every song
+KICK_ON = _MSG3.pack(0x99, 36, 110)
+KICK_OFF = _MSG3.pack(0x89, 36, 0)
+SNARE_ON = _MSG3.pack(0x99, 38, 100)
+SNARE_OFF = _MSG3.pack(0x89, 38, 0)
+HAT_OFF = _MSG3.pack(0x89, 42, 0)
+
+# 16-step drum pattern: the hits on each step as (note, velocity, release
+# ticks, note-on, note-off). A note-on of None is humanized per song.
+# Kick on 1 and 3, snare on 4 and 12, and Hi-Hats with "Groove"
+# (loud-soft-loud-soft) on every 8th.
+_KICK = (36, 110, 100, KICK_ON, KICK_OFF)
+_SNARE = (38, 100, 100, SNARE_ON, SNARE_OFF)
+_HAT_LOUD = (42, 90, 60, None, HAT_OFF)
+_HAT_SOFT = (42, 65, 60, None, HAT_OFF)
+DRUM_STEPS = (
+    (_KICK, _HAT_LOUD), (), (_HAT_SOFT,), (),
+    (_SNARE, _HAT_LOUD), (), (_HAT_SOFT,), (),
+    (_KICK, _HAT_LOUD), (), (_HAT_SOFT,), (),
+    (_SNARE, _HAT_LOUD), (), (_HAT_SOFT,), (),
+)
+
+def _drum_bar_template() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # One bar of DRUM_STEPS flattened to (ticks, msgs) in tick order: each
+    # step's hits, then its releases by release time (all before the next
+    # step). Also returns the rows whose velocity is humanized.
+    ticks, msgs, humanized = [], [], []
+    for i, hits in enumerate(DRUM_STEPS):
+        t = i * (PPQN // 4)
+        for note, vel, _, on, _ in hits:
+            if on is None:
+                humanized.append(len(msgs))
+                on = _MSG3.pack(0x99, note, vel)
+            ticks.append(t)
+            msgs.append(on)
+        for _, _, release, _, off in sorted(hits, key=itemgetter(2)):
+            ticks.append(t + release)
+            msgs.append(off)
+    return (np.array(ticks, dtype=np.int64),
+            np.frombuffer(b"".join(msgs), dtype=np.uint8).reshape(-1, 3),
+            np.array(humanized, dtype=np.intp))
+
+_DRUM_BAR_TICKS, _DRUM_BAR_MSGS, _DRUM_HUMANIZED = _drum_bar_template()
+
+def make_drums(params: SongParams, bar_ticks: int, rng: Optional[np.random.Generator] = None):
+    if rng is None:
+        rng = _song_rng(params.seed, 999)
+    # Velocity jitter for every humanized hit of every bar, in table order
+    jitter = rng.integers(-5, 6, (params.bars, len(_DRUM_HUMANIZED)))
+
+    # Every bar is the template shifted to its start tick
+    ticks = np.arange(params.bars)[:, None] * bar_ticks + _DRUM_BAR_TICKS
+    msgs = np.tile(_DRUM_BAR_MSGS, (params.bars, 1, 1))
+    msgs[:, _DRUM_HUMANIZED, 2] = _DRUM_BAR_MSGS[_DRUM_HUMANIZED, 2] + jitter
+    return ticks.ravel(), msgs.reshape(-1, 3)
 
 def generate_song_bytes(params: SongParams) -> bytes:
     bar_ticks = params.time_sig_num * PPQN
     tempo = int(60_000_000 / params.bpm)
     
     # Meta Track
-    t0_events = [(0, [0xFF, 0x51, 0x03] + list(tempo.to_bytes(3, "big")))]
-    
-    chord_ev, chord_degs = make_chords(params, bar_ticks)
-    melody_ev = make_melody(params, chord_degs, bar_ticks)
-    drum_ev = make_drums(params, bar_ticks)
-
-    tracks = [
-        build_track(t0_events),
-        build_track(chord_ev),
-        build_track(melody_ev),
-        build_track(drum_ev)
-    ]
+    t0_events = [(0, b"\xff\x51\x03" + tempo.to_bytes(3, "big"))]
     
-    header = b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), PPQN)
-    chunks = [b"MTrk" + struct.pack(">I", len(t)) + t for t in tracks]
-    return header + b"".join(chunks)
+    # One generator per song; the voices draw from it in a fixed order
+    rng = _song_rng(params.seed)
+    chords, chord_degs = make_chords(params, bar_ticks, rng)
+    melody = make_melody(params, chord_degs, bar_ticks, rng)
+    drums = make_drums(params, bar_ticks, rng)
+
+    # Chords and melody come back in tick order. The 16-step drum grid only
+    # stays inside a bar of 4+ beats; shorter bars overlap the next one and
+    # still need the full sort.
+    grid_fits = bar_ticks >= 16 * (PPQN // 4)
+    voices = [(*chords, True), (*melody, True), (*drums, grid_fits)]
+
+    # Single pass: every chunk is written straight into one worst-case buffer
+    # (channel tracks: 8-byte header, <= 7 bytes per event, 7-byte end)
+    cap = 14 + _track_capacity(t0_events) + sum(15 + 7 * len(ticks) for ticks, _, _ in voices)
+    buf = bytearray(cap)
+    buf[0:4] = b"MThd"
+    _HDR.pack_into(buf, 4, 6, 1, 1 + len(voices), PPQN)
+    off = write_track_into(buf, 14, t0_events, presorted=True)
+    for ticks, msgs, presorted in voices:
+        off = write_events_into(buf, off, ticks, msgs, presorted)
+    return bytes(memoryview(buf)[:off])
+
+# Songs are fully determined by their params (seed included), so repeated
+# requests are served from a small LRU keyed by a digest of the params
+_SONG_CACHE: "OrderedDict[bytes, bytes]" = OrderedDict()
+_SONG_CACHE_SIZE = 256
+_SONG_CACHE_LOCK = threading.Lock()
 
 def generate_song_bytes_from_dict(d: Dict) -> bytes:
     params = SongParams()
     for k, v in d.items():
         if hasattr(params, k): setattr(params, k, v)
-    return generate_song_bytes(params)
+
+    key = hashlib.blake2b(repr(astuple(params)).encode(), digest_size=16).digest()
+    with _SONG_CACHE_LOCK:
+        song = _SONG_CACHE.get(key)
+        if song is not None:
+            _SONG_CACHE.move_to_end(key)
+            return song
+
+    song = generate_song_bytes(params)
+    with _SONG_CACHE_LOCK:
+        _SONG_CACHE[key] = song
+        if len(_SONG_CACHE) > _SONG_CACHE_SIZE:
+            _SONG_CACHE.popitem(last=False)
+    return song